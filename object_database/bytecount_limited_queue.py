@@ -12,6 +12,7 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import collections
 import threading
 import queue
 
@@ -25,13 +26,18 @@ class BytecountLimitedQueue(object):
 
     def __init__(self, bytecountFunction, maxBytes=None):
         self._bytecountFunction = bytecountFunction
-        self._canPushCondition = threading.Condition(threading.Lock())
-        self._underlyingQueue = queue.Queue()
+
+        # a single lock guards the messages and the bytecount, so a put or a get
+        # only ever takes one lock.
+        self._lock = threading.Lock()
+        self._canPushCondition = threading.Condition(self._lock)
+        self._canGetCondition = threading.Condition(self._lock)
+        self._messages = collections.deque()
         self.totalBytes = 0
         self.maxBytes = None
 
     def pendingCount(self):
-        return self._underlyingQueue.qsize()
+        return len(self._messages)
 
     def setMaxBytes(self, bytecount):
         self.maxBytes = bytecount
@@ -52,15 +58,23 @@ class BytecountLimitedQueue(object):
                     raise queue.Full()
 
             self.totalBytes += msgLen
-            self._underlyingQueue.put(msg)
+            self._messages.append(msg)
+            self._canGetCondition.notify()
 
     def isBlocked(self):
         return self.maxBytes is not None and self.totalBytes >= self.maxBytes
 
     def get(self, timeout=None):
-        msg = self._underlyingQueue.get(timeout=timeout)
+        with self._canGetCondition:
+            if not self._messages:
+                if timeout is not None and timeout <= 0:
+                    raise queue.Empty()
+
+                if not self._canGetCondition.wait_for(lambda: self._messages, timeout):
+                    raise queue.Empty()
+
+            msg = self._messages.popleft()
 
-        with self._canPushCondition:
             blocked = self.isBlocked()
 
             self.totalBytes -= self._bytecountFunction(msg)
@@ -19,12 +19,6 @@ import logging
 import signal
 import sys
 
-from object_database import connect
-from object_database.util import validateLogLevel, configureLogging
-from object_database.service_manager.Codebase import setCodebaseInstantiationDirectory
-from object_database.service_manager.ServiceWorker import ServiceWorker
-from object_database.service_manager.logfiles import Logfile
-
 
 def main(argv):
     parser = argparse.ArgumentParser("Run a specific service.")
@@ -44,6 +38,14 @@ def main(argv):
 
     parsedArgs = parser.parse_args(argv[1:])
 
+    # importing object_database pulls in typed_python and the compiled extensions,
+    # so we only pay for it once we know the arguments are valid.
+    from object_database import connect
+    from object_database.util import validateLogLevel, configureLogging
+    from object_database.service_manager.Codebase import setCodebaseInstantiationDirectory
+    from object_database.service_manager.ServiceWorker import ServiceWorker
+    from object_database.service_manager.logfiles import Logfile
+
     level = parsedArgs.log_level.upper()
     level = validateLogLevel(level, fallback="INFO")
 
@@ -81,6 +83,20 @@ def main(argv):
 
     setCodebaseInstantiationDirectory(parsedArgs.sourceDir)
 
+    # install the handlers before we connect and build the worker, so that a
+    # signal that arrives during startup still shuts us down cleanly.
+    manager = None
+
+    def shutdownCleanly(signalNumber, frame):
+        logger.info("Received signal %s. Stopping.", signalNumber)
+        if manager is not None:
+            manager.stop()
+        else:
+            sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdownCleanly)
+    signal.signal(signal.SIGTERM, shutdownCleanly)
+
     try:
 
         def dbConnectionFactory():
@@ -105,13 +121,6 @@ def main(argv):
             ownsProcess=True,
         )
 
-        def shutdownCleanly(signalNumber, frame):
-            logger.info("Received signal %s. Stopping.", signalNumber)
-            manager.stop()
-
-        signal.signal(signal.SIGINT, shutdownCleanly)
-        signal.signal(signal.SIGTERM, shutdownCleanly)
-
         exitedGracefully = manager.runAndWaitForShutdown()
         retval = 0 if exitedGracefully else 1
         return retval
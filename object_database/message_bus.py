@@ -18,6 +18,10 @@ Classes for maintaining a strongly-typed message bus over sockets,
 along with classes to simulate this in tests.
 """
 
+import collections
+import functools
+import heapq
+import itertools
 import ssl
 import time
 import threading
@@ -26,7 +30,6 @@ import struct
 import logging
 import os
 import socket
-import sortedcontainers
 
 from typed_python import Alternative, NamedTuple, TypeFunction, serialize, deserialize
 
@@ -35,8 +38,22 @@ from object_database.bytecount_limited_queue import BytecountLimitedQueue
 from object_database.socket_watcher import SocketWatcher
 
 MESSAGE_LEN_BYTES = 4  # sizeof an int32 used to pack messages
+# native byte order, to match the length prefixes written by DatabaseConnectionPumpLoop
+MESSAGE_LEN_STRUCT = struct.Struct("i")
 EPOLL_TIMEOUT = 5.0
 MSG_BUF_SIZE = 128 * 1024
+# the most encoded messages we'll hand to a single vectored 'sendmsg' call
+MAX_CHUNKS_PER_SEND = 64
+
+# how many closed connections' receive buffers we hold on to for new connections
+MAX_SPARE_RECEIVE_BUFFERS = 32
+
+# how many endpoints we remember a TLS session for, to resume on reconnect
+MAX_SSL_SESSIONS = 256
+
+# queue.SimpleQueue (python 3.7+) is implemented in C and skips the task-tracking
+# locks and conditions of queue.Queue. Fall back to queue.Queue on python 3.6.
+SimpleQueue = getattr(queue, "SimpleQueue", queue.Queue)
 
 
 class MessageBusLoopExit(Exception):
@@ -48,7 +65,17 @@ class CorruptMessageStream(Exception):
 
 
 class MessageBuffer:
-    def __init__(self, extraMessageSizeCheck: bool):
+    # we leave room to receive this many bytes on every recv, as many as a single
+    # 'recv(MSG_BUF_SIZE)' would have handed us.
+    RECV_BYTES = MSG_BUF_SIZE
+
+    # once all received bytes are consumed, we give back capacity above this,
+    # so a connection that once received a large message doesn't pin the memory.
+    # It's room for a full recv on top of a partly received message, so a busy
+    # connection doesn't grow and trim its buffer over and over.
+    MAX_IDLE_CAPACITY = 2 * RECV_BYTES
+
+    def __init__(self, extraMessageSizeCheck: bool, storage=None):
         """ The buffer we're reading
 
         Args:
@@ -56,74 +83,284 @@ class MessageBuffer:
                 preceeded by an integer value (4 bytes) that corresponds to the
                 number of bytes of the message, but it is also followed by the
                 same integer value.
+            storage (bytearray or None): capacity to receive into, usually taken
+                from a closed connection with 'releaseStorage'. Its contents are
+                ignored.
         """
-        self.buffer = bytearray()
+        self.buffer = storage if storage is not None else bytearray()
         self.messagesEver = 0
         self.extraMessageSizeCheck = extraMessageSizeCheck
 
+        # the offset in 'buffer' of the first byte we haven't consumed yet.
+        # We advance this instead of deleting bytes from the front of the
+        # buffer, which would move the remaining bytes on every message.
+        self.readPos = 0
+
+        # the offset in 'buffer' just past the last byte we've received. Bytes
+        # after it are spare capacity that sockets receive directly into.
+        self.writePos = 0
+
         # the current message length, if any.
         self.curMessageLen = None
 
     def pendingBytecount(self):
-        return len(self.buffer)
+        return self.writePos - self.readPos
 
     @staticmethod
     def encode(bytes, extraMessageSizeCheck: bool):
         """Prepend a message-length prefix"""
-        res = bytearray(struct.pack("i", len(bytes)))
-        res.extend(bytes)
+        msgLen = len(bytes)
+
+        res = bytearray(
+            MESSAGE_LEN_BYTES + msgLen + (MESSAGE_LEN_BYTES if extraMessageSizeCheck else 0)
+        )
+        MESSAGE_LEN_STRUCT.pack_into(res, 0, msgLen)
+        res[MESSAGE_LEN_BYTES : MESSAGE_LEN_BYTES + msgLen] = bytes
 
         if extraMessageSizeCheck:
-            res.extend(struct.pack("i", len(bytes)))
+            MESSAGE_LEN_STRUCT.pack_into(res, MESSAGE_LEN_BYTES + msgLen, msgLen)
 
         return res
 
+    def receiveFrom(self, sock):
+        """Receive bytes from 'sock' straight into the buffer's spare capacity.
+
+        Exceptions raised by the socket propagate to the caller.
+
+        Returns:
+            The number of bytes received, which is 0 if the socket has closed.
+            Call 'readMessages' to collect any messages they completed.
+        """
+        self._reserve(self.RECV_BYTES)
+
+        with memoryview(self.buffer) as view:
+            bytesReceived = sock.recv_into(
+                view[self.writePos : self.writePos + self.RECV_BYTES]
+            )
+
+        self.writePos += bytesReceived
+
+        return bytesReceived
+
     def write(self, bytesToWrite):
         """Push bytes into the buffer and read any completed messages.
 
         Args:
-            bytesToWrite (bytes) - a portion of the message stream
+            bytesToWrite (bytes-like) - a portion of the message stream
 
         Returns:
             A list of messages completed by the bytes.
         """
+        bytecount = len(bytesToWrite)
+
+        self._reserve(bytecount)
+        self.buffer[self.writePos : self.writePos + bytecount] = bytesToWrite
+        self.writePos += bytecount
+
+        return self.readMessages()
+
+    def readMessages(self):
+        """Consume and return a list of the complete messages in the buffer."""
+        # this runs on every recv, so we keep the parse state in locals and
+        # only write it back to 'self' once we've consumed what we can.
         messages = []
+        buffer = self.buffer
+        bufferLen = self.writePos
+        readPos = self.readPos
+        msgLen = self.curMessageLen
+        unpackLength = MESSAGE_LEN_STRUCT.unpack_from
+        trailerBytes = MESSAGE_LEN_BYTES if self.extraMessageSizeCheck else 0
 
-        self.buffer.extend(bytesToWrite)
+        try:
+            with memoryview(buffer) as view:
+                while True:
+                    if msgLen is None:
+                        if bufferLen - readPos < MESSAGE_LEN_BYTES:
+                            return messages
 
-        while True:
-            if self.curMessageLen is None:
-                if len(self.buffer) >= MESSAGE_LEN_BYTES:
-                    self.curMessageLen = struct.unpack("i", self.buffer[:MESSAGE_LEN_BYTES])[0]
-                    self.buffer[:MESSAGE_LEN_BYTES] = b""
+                        msgLen = unpackLength(buffer, readPos)[0]
+                        readPos += MESSAGE_LEN_BYTES
 
-            if self.curMessageLen is None:
-                return messages
+                    if bufferLen - readPos < msgLen + trailerBytes:
+                        return messages
 
-            if self.extraMessageSizeCheck:
-                if len(self.buffer) >= self.curMessageLen + MESSAGE_LEN_BYTES:
-                    messages.append(bytes(self.buffer[: self.curMessageLen]))
-                    self.messagesEver += 1
-                    msgLen = self.curMessageLen
-                    sizeCheckBytes = self.buffer[msgLen : msgLen + MESSAGE_LEN_BYTES]
-                    sizeCheck = struct.unpack("i", sizeCheckBytes)[0]
+                    messages.append(bytes(view[readPos : readPos + msgLen]))
+                    readPos += msgLen
 
-                    self.buffer[: msgLen + MESSAGE_LEN_BYTES] = b""
-                    self.curMessageLen = None
+                    if trailerBytes:
+                        sizeCheck = unpackLength(buffer, readPos)[0]
+                        readPos += MESSAGE_LEN_BYTES
 
-                    if sizeCheck != msgLen:
-                        raise CorruptMessageStream(f"{sizeCheck} != {msgLen}")
+                        if sizeCheck != msgLen:
+                            badLen, msgLen = msgLen, None
+                            raise CorruptMessageStream(f"{sizeCheck} != {badLen}")
 
-                else:
-                    return messages
-            else:
-                if len(self.buffer) >= self.curMessageLen:
-                    messages.append(bytes(self.buffer[: self.curMessageLen]))
-                    self.messagesEver += 1
-                    self.buffer[: self.curMessageLen] = b""
-                    self.curMessageLen = None
-                else:
-                    return messages
+                    msgLen = None
+        finally:
+            self.readPos = readPos
+            self.curMessageLen = msgLen
+            self.messagesEver += len(messages)
+            self._compact()
+
+    def releaseStorage(self):
+        """Give up our bytearray so that another MessageBuffer can reuse its capacity."""
+        storage = self.buffer
+        del storage[self.MAX_IDLE_CAPACITY :]
+
+        self.buffer = bytearray()
+        self.readPos = 0
+        self.writePos = 0
+        self.curMessageLen = None
+
+        return storage
+
+    def _compact(self):
+        """Reset to the front of the buffer once everything received has been consumed."""
+        if self.readPos == self.writePos:
+            self.readPos = 0
+            self.writePos = 0
+
+            if len(self.buffer) > self.MAX_IDLE_CAPACITY:
+                del self.buffer[self.MAX_IDLE_CAPACITY :]
+
+    def _reserve(self, bytecount):
+        """Make sure there are at least 'bytecount' bytes of spare capacity."""
+        if len(self.buffer) - self.writePos >= bytecount:
+            return
+
+        if self.readPos:
+            # slide the unconsumed bytes back to the front of the buffer
+            pending = self.writePos - self.readPos
+            self.buffer[:pending] = self.buffer[self.readPos : self.writePos]
+            self.readPos = 0
+            self.writePos = pending
+
+        shortfall = bytecount - (len(self.buffer) - self.writePos)
+
+        if shortfall > 0:
+            # grow geometrically so a large message doesn't cost a resize per recv
+            self.buffer.extend(bytes(max(shortfall, len(self.buffer))))
+
+
+class PendingWriteBuffer:
+    def __init__(self):
+        """ The encoded messages waiting to be written to a single socket.
+
+        Messages are kept as separate chunks rather than being copied into one
+        contiguous buffer. Plain sockets write several of them with a single
+        vectored 'sendmsg'. SSL sockets can't do vectored writes, so they get
+        the chunks at the front joined into one buffer per send.
+        """
+        self.chunks = collections.deque()
+
+        # the number of bytes at the front of chunks[0] already written
+        self.headOffset = 0
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+
+    def sendTo(self, sock):
+        """Write as much as the socket will take and return the number of bytes sent.
+
+        Exceptions raised by the socket propagate to the caller.
+        """
+        if isinstance(sock, ssl.SSLSocket):
+            bytesWritten = sock.send(self._headBytes(MSG_BUF_SIZE))
+        else:
+            bytesWritten = sock.sendmsg(self._headViews(MAX_CHUNKS_PER_SEND))
+
+        self._consume(bytesWritten)
+
+        return bytesWritten
+
+    def _headViews(self, maxChunks):
+        """Return the unwritten parts of the first 'maxChunks' chunks."""
+        views = list(itertools.islice(self.chunks, maxChunks))
+
+        if self.headOffset:
+            views[0] = memoryview(views[0])[self.headOffset :]
+
+        return views
+
+    def _headBytes(self, maxBytes):
+        """Return the unwritten bytes at the front of the buffer as one bytes-like object.
+
+        We join whole chunks until we have at least 'maxBytes'. SSL requires that a
+        write retried after SSLWantWriteError see the same leading bytes, which holds
+        because we only ever take chunks from the front, and the only way the
+        result changes is by growing when a chunk is appended.
+        """
+        head = memoryview(self.chunks[0])[self.headOffset :]
+
+        if len(self.chunks) == 1 or len(head) >= maxBytes:
+            return head
+
+        parts = [head]
+        bytecount = len(head)
+
+        for chunk in itertools.islice(self.chunks, 1, None):
+            if bytecount >= maxBytes:
+                break
+
+            parts.append(chunk)
+            bytecount += len(chunk)
+
+        return b"".join(parts)
+
+    def _consume(self, bytecount):
+        """Drop 'bytecount' written bytes from the front of the buffer."""
+        offset = self.headOffset + bytecount
+        chunks = self.chunks
+
+        while chunks and offset >= len(chunks[0]):
+            offset -= len(chunks[0])
+            chunks.popleft()
+
+        self.headOffset = offset
+
+
+class ConnectionState:
+    """ Everything the MessageBus tracks about a single connection. """
+
+    __slots__ = (
+        "connectionId",
+        "isIncoming",
+        "endpoint",
+        "socket",
+        "messageBuffer",
+        "isUnauthenticated",
+        "messagesForUnconnectedSocket",
+        "pendingWrites",
+        "failedToDeserialize",
+    )
+
+    def __init__(self, connectionId, isIncoming, endpoint):
+        self.connectionId = connectionId
+        self.isIncoming = isIncoming
+        self.endpoint = endpoint
+
+        # the socket, or None if this is an outgoing connection we haven't formed yet
+        self.socket = None
+        self.messageBuffer = None
+        self.isUnauthenticated = False
+
+        # encoded messages scheduled before an outgoing connection's socket exists
+        self.messagesForUnconnectedSocket = []
+
+        # PendingWriteBuffer of bytes that need to be written to 'socket', or None
+        # if there aren't any. Guarded by the MessageBus's lock.
+        self.pendingWrites = None
+
+        # set by the eventThread once a message on this connection fails to
+        # deserialize. We drop its remaining messages while it gets closed.
+        self.failedToDeserialize = False
+
+    @property
+    def isPendingOutgoingConnection(self):
+        return not self.isIncoming and self.socket is None
 
 
 class Disconnected:
@@ -249,30 +486,38 @@ class MessageBus(object):
         self.inMessageType = inMessageType
         self.outMessageType = outMessageType
         self.eventType = MessageBusEvent(inMessageType)
-        self._eventQueue = queue.Queue()
+        # events and callbacks for the eventThread. It blocks on this queue,
+        # so it can't be a bare deque.
+        self._eventQueue = SimpleQueue()
         self._authToken = authToken
+        # what the other side actually sends (and we compare against) on the wire.
+        self._authTokenBytes = authToken.encode("utf8") if authToken is not None else None
         self._listeningEndpoint = Endpoint(endpoint) if endpoint is not None else None
         self._lock = threading.RLock()
         self.started = False
         self._acceptSocket = None
         self.extraMessageSizeCheck = extraMessageSizeCheck
 
-        self._connIdToIncomingSocket = {}  # connectionId -> socket
-        self._connIdToOutgoingSocket = {}  # connectionId -> socket
-
-        self._socketToIncomingConnId = {}  # socket -> connectionId
-        self._socketToOutgoingConnId = {}  # socket -> connectionId
+        self._connections = {}  # connectionId -> ConnectionState
+        self._socketToConnection = {}  # socket -> ConnectionState
 
-        self._unauthenticatedConnections = set()
-        self._connIdToIncomingEndpoint = {}  # connectionId -> Endpoint
-        self._connIdToOutgoingEndpoint = {}  # connectionId -> Endpoint
-        self._connIdPendingOutgoingConnection = set()
-        self._messagesForUnconnectedOutgoingConnection = {}  # connectionId- > [bytes]
+        # bytearrays from the MessageBuffers of closed connections, which new
+        # connections receive into instead of allocating and growing their own.
+        self._spareReceiveBuffers = collections.deque(maxlen=MAX_SPARE_RECEIVE_BUFFERS)
 
         self._messageToSendWakePipe = None
         self._eventToFireWakePipe = None
         self._generalWakePipe = None
 
+        # True if a wake byte has been written to the corresponding pipe and the
+        # socket thread hasn't consumed it yet. Producers only write to a pipe
+        # when this flips from False to True, so a burst of messages costs a
+        # single wakeup. Guarded by '_wakePipeLock'.
+        self._messageToSendWakePending = False
+        self._eventToFireWakePending = False
+        self._generalWakePending = False
+        self._wakePipeLock = threading.Lock()
+
         # how many bytes do we actually have in our deserialized pump loop
         # waiting to be sent down the wire.
         self.totalBytesPendingInOutputLoop = 0
@@ -288,24 +533,38 @@ class MessageBus(object):
         # how many bytes have we actually read (from anybody)
         self.totalBytesRead = 0
 
-        self._connectionIdCounter = 0
+        # next() on an itertools.count is atomic, so handing out ids needs no lock
+        self._connectionIdCounter = itertools.count(1)
 
         # queue of messages to write to other endpoints
         self._messagesToSendQueue = BytecountLimitedQueue(self._bytesPerMsg)
-        self._eventsToFireQueue = queue.Queue()
+        # control messages (TriggerConnect and Disconnected) for the socketThread.
+        # They carry no bytes, so they skip the bytecount limit and are always
+        # handled before anything in _messagesToSendQueue.
+        self._controlMessagesToSend = collections.deque()
+        # events for the socketThread to fire. Appended to by any thread and drained
+        # only by the socketThread, which is woken by _eventToFireWakePipe.
+        self._eventsToFireQueue = collections.deque()
 
         self._socketThread = threading.Thread(target=self._socketThreadLoop, daemon=True)
         self._eventThread = threading.Thread(target=self._eventThreadLoop, daemon=True)
         self._wantsSSL = wantsSSL
         self._sslContext = sslContext
 
-        # socket -> bytes that need to be written
-        self._socketToBytesNeedingWrite = {}
+        # sockets whose connection has 'pendingWrites'. The bytes themselves live on
+        # the ConnectionState; this is how the socketThread finds them all at once.
+        self._socketsWithPendingWrites = set()
+        # sockets that acquired pending bytes since the socketThread last registered
+        # write interest. Write interest is only changed when a socket's state changes,
+        # rather than re-registering every pending socket on every pass through the loop.
+        self._socketsWithNewPendingWrites = []
         self._socketsWithSslWantWrite = set()
         self._allSockets = None  # SocketWatcher
 
-        # dict from 'socket' object to MessageBuffer
-        self._incomingSocketBuffers = {}
+        # Endpoint -> the ssl.SSLSession of our last outgoing connection to it, so
+        # that reconnecting can resume the TLS session instead of doing a full handshake.
+        # Holds at most MAX_SSL_SESSIONS endpoints, least recently stored first.
+        self._sslSessionsByEndpoint = collections.OrderedDict()
 
         if self._wantsSSL:
             if self._sslContext is None:
@@ -318,11 +577,12 @@ class MessageBus(object):
                 self._sslContext is None
             ), "Makes no sense to give an ssl context and not request ssl"
 
-        # a set of (timestamp, callback) pairs of callbacks we're supposed
-        # to fire on the output thread.
-        self._pendingTimedCallbacks = sortedcontainers.SortedSet(
-            key=lambda tsAndCallback: tsAndCallback[0]
-        )
+        # a heap of (dueTime, sequenceNumber, callback) triples of callbacks we're
+        # supposed to fire on the output thread. dueTime is on the time.monotonic()
+        # clock. The sequence number breaks ties between equal due times, so we
+        # never compare the callbacks themselves.
+        self._pendingTimedCallbacks = []
+        self._timedCallbackSequence = itertools.count()
 
     @property
     def listeningEndpoint(self):
@@ -350,9 +610,9 @@ class MessageBus(object):
                 raise FailedToStart()
 
             # allocate the pipes that we use to wake our select loop.
-            self._messageToSendWakePipe = os.pipe()
-            self._eventToFireWakePipe = os.pipe()
-            self._generalWakePipe = os.pipe()
+            self._messageToSendWakePipe = self._makeWakePipe()
+            self._eventToFireWakePipe = self._makeWakePipe()
+            self._generalWakePipe = self._makeWakePipe()
 
             self._allSockets = SocketWatcher()
             self._allSockets.addForRead(self._generalWakePipe[0])
@@ -382,7 +642,8 @@ class MessageBus(object):
             self._listeningEndpoint,
         )
 
-        self._messagesToSendQueue.put(Disconnected)
+        self._controlMessagesToSend.append(Disconnected)
+        self._wakeForMessageToSend()
         self._scheduleEvent(self.eventType.Stopped())
 
         self._socketThread.join(timeout=timeout)
@@ -410,10 +671,7 @@ class MessageBus(object):
         closePipe(self._eventToFireWakePipe)
         closePipe(self._generalWakePipe)
 
-        for sock in self._connIdToIncomingSocket.values():
-            self._ensureSocketClosed(sock)
-
-        for sock in self._connIdToOutgoingSocket.values():
+        for sock in self._socketToConnection:
             self._ensureSocketClosed(sock)
 
         self._allSockets.teardown()
@@ -436,14 +694,15 @@ class MessageBus(object):
 
         with self._lock:
             connId = self._newConnectionId()
-            self._connIdToOutgoingEndpoint[connId] = endpoint
-            self._connIdPendingOutgoingConnection.add(connId)
+            self._connections[connId] = ConnectionState(connId, False, endpoint)
 
-        # TriggerConnect must go on the sendQueue and not the EventQueue
-        # in order for the auth_token to be sent (if necessary) before
+        # TriggerConnect must go through the socketThread's send path and not the
+        # EventQueue in order for the auth_token to be sent (if necessary) before
         # any subsequent sendMessage calls schedule messages on the connection.
-        # self._scheduleEvent((connId, TriggerConnect))
-        self._putOnSendQueue(connId, TriggerConnect)
+        # Control messages are always handled before queued data, which keeps
+        # that ordering.
+        self._controlMessagesToSend.append((connId, TriggerConnect))
+        self._wakeForMessageToSend()
 
         return connId
 
@@ -455,15 +714,21 @@ class MessageBus(object):
         self._scheduleEvent((connectionId, TriggerDisconnect))
 
     def _isDefinitelyDead(self, connectionId):
-        with self._lock:
-            return (
-                connectionId not in self._connIdToOutgoingEndpoint
-                and connectionId not in self._connIdToIncomingEndpoint
-            )
+        # a single dict membership test is atomic, so we don't need the lock here.
+        return connectionId not in self._connections
 
     def _putOnSendQueue(self, connectionId, msg):
         self._messagesToSendQueue.put((connectionId, msg))
-        assert os.write(self._messageToSendWakePipe[1], b" ") == 1
+        self._wakeForMessageToSend()
+
+    def _wakeForMessageToSend(self):
+        """ Accessed by: user threads & socketThread """
+        with self._wakePipeLock:
+            if self._messageToSendWakePending:
+                return
+            self._messageToSendWakePending = True
+
+        self._writeToWakePipe(self._messageToSendWakePipe)
 
     def scheduleCallback(self, callback, *, atTimestamp=None, delay=None):
         """Schedule a callback to fire on the message read thread.
@@ -483,21 +748,32 @@ class MessageBus(object):
         if atTimestamp is not None and delay is not None:
             raise ValueError("atTimestamp and delay arguments cannot both have values.")
 
-        if delay is None:
-            delay = 0.0
-
-        if atTimestamp is None:
-            atTimestamp = time.time() + (delay or 0.0)
+        # we keep due times on the monotonic clock, so a wall-clock step can't
+        # make callbacks fire early or late. 'atTimestamp' is converted once, here.
+        if atTimestamp is not None:
+            dueTime = time.monotonic() + (atTimestamp - time.time())
+        else:
+            dueTime = time.monotonic() + (delay or 0.0)
 
         with self._lock:
-            self._pendingTimedCallbacks.add((atTimestamp, callback))
+            entry = (dueTime, next(self._timedCallbackSequence), callback)
+            heapq.heappush(self._pendingTimedCallbacks, entry)
 
             # if we put this on the front of the queue, we need to wake
             # the thread loop
-            if self._pendingTimedCallbacks[0][0] == atTimestamp:
-                written = os.write(self._generalWakePipe[1], b" ")
-                if written != 1:
-                    raise Exception("Internal Error: Failed to write to general wake pipe")
+            if self._pendingTimedCallbacks[0] is not entry:
+                return
+
+        self._wakeGeneral()
+
+    def _wakeGeneral(self):
+        """ Accessed by: user threads & socketThread """
+        with self._wakePipeLock:
+            if self._generalWakePending:
+                return
+            self._generalWakePending = True
+
+        self._writeToWakePipe(self._generalWakePipe)
 
     def sendMessage(self, connectionId, message):
         """Send a message to another endpoint endpoint.
@@ -517,6 +793,10 @@ class MessageBus(object):
         if not self.started:
             raise Exception(f"Bus {self.busIdentity} is not active")
 
+        # check this first so we don't pay to serialize a message we're going to drop
+        if self._isDefinitelyDead(connectionId):
+            return False
+
         if self.serializationContext is None:
             serializedMessage = serialize(self.outMessageType, message)
         else:
@@ -524,27 +804,16 @@ class MessageBus(object):
                 message, serializeType=self.outMessageType
             )
 
-        if self._isDefinitelyDead(connectionId):
-            return False
-
         self._putOnSendQueue(connectionId, serializedMessage)
 
         return True
 
     def _newConnectionId(self):
         """ Accessed by: user threads & socketThread """
-        with self._lock:
-            self._connectionIdCounter += 1
-            return ConnectionId(id=self._connectionIdCounter)
+        return ConnectionId(id=next(self._connectionIdCounter))
 
     @staticmethod
     def _bytesPerMsg(msg):
-        if not isinstance(msg, tuple):
-            return 0
-
-        if msg[1] is TriggerConnect or msg[1] is TriggerDisconnect:
-            return 0
-
         return len(msg[1])
 
     def _scheduleEvent(self, event):
@@ -552,8 +821,33 @@ class MessageBus(object):
 
         Accessed by: user threads & socketThread
         """
-        self._eventsToFireQueue.put(event)
-        assert os.write(self._eventToFireWakePipe[1], b" ") == 1
+        self._eventsToFireQueue.append(event)
+
+        with self._wakePipeLock:
+            if self._eventToFireWakePending:
+                return
+            self._eventToFireWakePending = True
+
+        self._writeToWakePipe(self._eventToFireWakePipe)
+
+    @staticmethod
+    def _makeWakePipe():
+        """ Accessed by: user threads via bus.start() """
+        readFd, writeFd = os.pipe()
+
+        # writers never need to block: if the pipe is full, it's already readable.
+        os.set_blocking(writeFd, False)
+
+        return readFd, writeFd
+
+    @staticmethod
+    def _writeToWakePipe(wakePipe):
+        """ Accessed by: user threads & socketThread """
+        try:
+            os.write(wakePipe[1], b" ")
+        except BlockingIOError:
+            # the pipe is full, so the socketThread is going to wake up anyways
+            pass
 
     def _setupAcceptSocket(self):
         """ Accessed by: user threads via bus.start() """
@@ -599,44 +893,75 @@ class MessageBus(object):
             return True
 
     def _scheduleBytesForWrite(self, connId, msg):
-        """ Accessed by: socketThread and eventThread
-
-        It is called under self._lock when called by the eventThread (through _connectTo)
-        and not under self._lock when called from the socketThread
-
-        """
+        """ Accessed by: socketThread """
         if not msg:
             return
 
-        if connId in self._connIdToOutgoingSocket:
-            sslSock = self._connIdToOutgoingSocket.get(connId)
+        # encode outside the lock, so we only take it once per message.
+        msgBytes = MessageBuffer.encode(msg, self.extraMessageSizeCheck)
 
-        elif connId in self._connIdToIncomingSocket:
-            sslSock = self._connIdToIncomingSocket.get(connId)
+        with self._lock:
+            connection = self._connections.get(connId)
 
-        else:
-            # we're not connected yet, so we can't put this on the buffer
-            # so instead, put it on a pending buffer.
-            if connId not in self._connIdPendingOutgoingConnection:
-                # if we don't have one, it's because we disconnected
+            if connection is None:
+                # we disconnected
                 return
 
-            with self._lock:
-                self._messagesForUnconnectedOutgoingConnection.setdefault(connId, []).append(
-                    msg
-                )
+            if connection.socket is None:
+                # we're not connected yet, so we can't put this on the buffer
+                # so instead, put it on a pending buffer.
+                connection.messagesForUnconnectedSocket.append(msgBytes)
+                return
 
-            return
+            self._queueBytesForConnection(connection, msgBytes)
 
-        msgBytes = MessageBuffer.encode(msg, self.extraMessageSizeCheck)
+    def _queueBytesForConnection(self, connection, msgBytes):
+        """ Accessed by: socketThread and eventThread (through _connectTo)
+
+        Must be called under self._lock.
+        """
+        self.totalBytesPendingInOutputLoop += len(msgBytes)
+
+        pendingWrites = connection.pendingWrites
+
+        if pendingWrites is None:
+            pendingWrites = connection.pendingWrites = PendingWriteBuffer()
+            self._socketsWithPendingWrites.add(connection.socket)
+            self._socketsWithNewPendingWrites.append(connection.socket)
+
+        pendingWrites.append(msgBytes)
 
+    def _dropPendingWrites(self, connection):
+        """ Forget any bytes 'connection' still had to write.
+
+        Must be called under self._lock.
+        """
+        connection.pendingWrites = None
+        self._socketsWithPendingWrites.discard(connection.socket)
+
+    def _takeSocketsWithNewPendingWrites(self):
+        """ Return (and forget) the sockets that acquired pending bytes since the last call.
+
+        Accessed by: socketThread
+        """
         with self._lock:
-            self.totalBytesPendingInOutputLoop += len(msgBytes)
+            if not self._socketsWithNewPendingWrites:
+                return ()
 
-            if sslSock not in self._socketToBytesNeedingWrite:
-                self._socketToBytesNeedingWrite[sslSock] = bytearray(msgBytes)
-            else:
-                self._socketToBytesNeedingWrite[sslSock].extend(msgBytes)
+            sockets = self._socketsWithNewPendingWrites
+            self._socketsWithNewPendingWrites = []
+            return sockets
+
+    def _requeueSocketsWithNewPendingWrites(self, sockets):
+        """ Hand back sockets from '_takeSocketsWithNewPendingWrites' we failed to watch.
+
+        Accessed by: socketThread
+        """
+        if not sockets:
+            return
+
+        with self._lock:
+            self._socketsWithNewPendingWrites.extend(sockets)
 
     def _handleReadReadySocket(self, socketWithData):
         """ Our select loop indicated 'socketWithData' has data pending.
@@ -658,14 +983,12 @@ class MessageBus(object):
 
                 with self._lock:
                     connId = self._newConnectionId()
-                    if self._authToken is not None:
-                        self._unauthenticatedConnections.add(connId)
-                    self._connIdToIncomingSocket[connId] = newSocket
-                    self._socketToIncomingConnId[newSocket] = connId
-                    self._connIdToIncomingEndpoint[connId] = newSocketSource
-                    self._incomingSocketBuffers[newSocket] = MessageBuffer(
-                        self.extraMessageSizeCheck
-                    )
+                    connection = ConnectionState(connId, True, newSocketSource)
+                    connection.socket = newSocket
+                    connection.messageBuffer = self._newMessageBuffer()
+                    connection.isUnauthenticated = self._authToken is not None
+                    self._connections[connId] = connection
+                    self._socketToConnection[newSocket] = connection
                     self._allSockets.addForRead(newSocket)
 
                 self._fireEvent(
@@ -677,45 +1000,45 @@ class MessageBus(object):
                 return True
 
         elif socketWithData in self._allSockets:
+            connection = self._socketToConnection[socketWithData]
+            messageBuffer = connection.messageBuffer
+            oldBytecount = messageBuffer.pendingBytecount()
+
             try:
-                bytesReceived = socketWithData.recv(MSG_BUF_SIZE)
+                bytesReceived = messageBuffer.receiveFrom(socketWithData)
             except ssl.SSLWantReadError:
                 bytesReceived = None
             except ssl.SSLWantWriteError:
                 self._socketsWithSslWantWrite.add(socketWithData)
+                bytesReceived = None
             except ConnectionResetError:
-                bytesReceived = b""
+                bytesReceived = 0
             except Exception:
                 self._logger.exception("MessageBus read socket shutting down")
-                bytesReceived = b""
+                bytesReceived = 0
 
             if bytesReceived is None:
                 # do nothing
                 pass
-            elif bytesReceived == b"":
+            elif bytesReceived == 0:
                 self._markSocketClosed(socketWithData)
                 return True
             else:
-                self.totalBytesRead += len(bytesReceived)
-
-                messageBuffer = self._incomingSocketBuffers[socketWithData]
-                oldBytecount = messageBuffer.pendingBytecount()
+                self.totalBytesRead += bytesReceived
 
                 try:
-                    newMessages = messageBuffer.write(bytesReceived)
+                    newMessages = messageBuffer.readMessages()
 
                 except CorruptMessageStream:
-                    connId = self._getConnectionIdFromSocket(socketWithData)
-                    if connId is not None:
-                        self._logger.error(
-                            f"Closing connection {connId} due to corrupted message stream."
-                        )
+                    self._logger.error(
+                        f"Closing connection {connection.connectionId} "
+                        "due to corrupted message stream."
+                    )
                     self._markSocketClosed(socketWithData)
                     return True
 
                 self.totalBytesPendingInInputLoop += (
-                    self._incomingSocketBuffers[socketWithData].pendingBytecount()
-                    - oldBytecount
+                    messageBuffer.pendingBytecount() - oldBytecount
                 )
 
                 self.totalBytesPendingInInputLoopHighWatermark = max(
@@ -724,7 +1047,7 @@ class MessageBus(object):
                 )
 
                 for m in newMessages:
-                    if not self._handleIncomingMessage(m, socketWithData):
+                    if not self._handleIncomingMessage(m, connection):
                         self._markSocketClosed(socketWithData)
                         break
 
@@ -736,26 +1059,47 @@ class MessageBus(object):
             )
 
     def _socketThreadLoop(self):
-        t0 = time.time()
+        t0 = time.monotonic()
         selectsWithNoUpdate = 0
+        writesSuspended = False
+
+        # none of these are ever rebound once the bus is started, and this loop runs
+        # for the life of the bus, so we look them up once.
+        allSockets = self._allSockets
+        messagesToSendQueue = self._messagesToSendQueue
+        controlMessagesToSend = self._controlMessagesToSend
+        socketsWithPendingWrites = self._socketsWithPendingWrites
+        messageToSendWakeFd = self._messageToSendWakePipe[0]
+        consumeCallbacksOnOutputThread = self._consumeCallbacksOnOutputThread
+        takeSocketsWithNewPendingWrites = self._takeSocketsWithNewPendingWrites
+        requeueSocketsWithNewPendingWrites = self._requeueSocketsWithNewPendingWrites
+        handleReadReadySocket = self._handleReadReadySocket
+        handleWriteReadySocket = self._handleWriteReadySocket
+
+        # readable wake pipes dispatch straight to their handler. Anything not
+        # in here is a connection socket (or the accept socket).
+        wakePipeHandlers = {
+            messageToSendWakeFd: self._handleMessageToSendWakePipe,
+            self._eventToFireWakePipe[0]: self._handleEventToFireWakePipe,
+            self._generalWakePipe[0]: self._handleGeneralWakePipe,
+        }
 
         while True:
             try:
-                if time.time() - t0 > 0.01:
-                    t0 = time.time()
+                now = time.monotonic()
+                if now - t0 > 0.01:
+                    t0 = now
                     selectsWithNoUpdate = 0
 
                 # don't read from the serialization queue unless we can handle the
                 # bytes in our 'self.totalBytesPendingInOutputLoop' flow
-                canRead = (
-                    self._messagesToSendQueue.maxBytes is None
-                    or self.totalBytesPendingInOutputLoop < self._messagesToSendQueue.maxBytes
-                )
+                maxBytes = messagesToSendQueue.maxBytes
+                canRead = maxBytes is None or self.totalBytesPendingInOutputLoop < maxBytes
 
                 # before going to sleep, flush any callbacks that need to fire. Note that
                 # we do this only if we're allowed to read messages also
                 if canRead:
-                    maxSleepTime = self._consumeCallbacksOnOutputThread()
+                    maxSleepTime = consumeCallbacksOnOutputThread()
                     if maxSleepTime is None:
                         maxSleepTime = EPOLL_TIMEOUT
                     else:
@@ -763,29 +1107,49 @@ class MessageBus(object):
                 else:
                     maxSleepTime = EPOLL_TIMEOUT
 
-                if canRead:
+                if canRead or controlMessagesToSend:
                     # only listen on this socket if we can actually absorb more
-                    # data. if we cant we'll wake up in EPOLL_TIMEOUT seconds, after
+                    # data (control messages carry none, so they always get through).
+                    # if we cant we'll wake up in EPOLL_TIMEOUT seconds, after
                     # which something should have flushed
-                    self._allSockets.addForRead(self._messageToSendWakePipe[0])
+                    allSockets.addForRead(messageToSendWakeFd)
                 else:
-                    self._allSockets.discardForRead(self._messageToSendWakePipe[0])
+                    allSockets.discardForRead(messageToSendWakeFd)
 
                 try:
-                    # if we're just spinning making no progress, don't bother
+                    # if we're just spinning making no progress, stop listening for
+                    # writes until the throttle resets.
                     if selectsWithNoUpdate < 10:
-                        for sock in self._socketToBytesNeedingWrite:
-                            self._allSockets.addForWrite(sock)
+                        socketsToWatch = takeSocketsWithNewPendingWrites()
 
-                    else:
-                        for sock in self._socketToBytesNeedingWrite:
-                            self._allSockets.discardForWrite(sock)
+                        if writesSuspended:
+                            writesSuspended = False
+                            socketsToWatch = list(socketsWithPendingWrites)
 
-                    readReady, writeReady = self._allSockets.poll(maxSleepTime)
+                        for ix, sock in enumerate(socketsToWatch):
+                            if sock in socketsWithPendingWrites:
+                                try:
+                                    allSockets.addForWrite(sock)
+                                except Exception:
+                                    # we already took these off the shared list. Put
+                                    # back the ones we didn't get to, or they'd never
+                                    # be watched for writes and their output would stall.
+                                    requeueSocketsWithNewPendingWrites(
+                                        socketsToWatch[ix + 1 :]
+                                    )
+                                    raise
+
+                    elif not writesSuspended:
+                        writesSuspended = True
+
+                        for sock in list(socketsWithPendingWrites):
+                            allSockets.discardForWrite(sock)
+
+                    readReady, writeReady = allSockets.poll(maxSleepTime)
 
                 except ValueError:
                     # one of the sockets must have failed
-                    failedSockets = self._allSockets.gc()
+                    failedSockets = allSockets.gc()
 
                     if not failedSockets:
                         # if not, then we don't have a good understanding of why this happened
@@ -794,42 +1158,40 @@ class MessageBus(object):
                     readReady = []
                     writeReady = []
 
-                    for s in failedSockets:
-                        if s in self._socketToBytesNeedingWrite:
-                            del self._socketToBytesNeedingWrite[s]
+                    with self._lock:
+                        for s in failedSockets:
+                            socketsWithPendingWrites.discard(s)
+
+                            connection = self._socketToConnection.get(s)
+                            if connection is not None:
+                                connection.pendingWrites = None
 
                 else:
                     didSomething = False
 
                     for socketWithData in readReady:
-                        if socketWithData == self._messageToSendWakePipe[0]:
-                            if canRead:
-                                self._handleMessageToSendWakePipe()
-                                didSomething = True
+                        wakePipeHandler = wakePipeHandlers.get(socketWithData)
 
-                        elif socketWithData == self._eventToFireWakePipe[0]:
-                            self._handleEventToFireWakePipe()
+                        if wakePipeHandler is not None:
+                            # the send pipe's handler only drains data while we're
+                            # under our byte limit
+                            wakePipeHandler()
                             didSomething = True
 
-                        elif socketWithData == self._generalWakePipe[0]:
-                            self._handleGeneralWakePipe()
+                        elif handleReadReadySocket(socketWithData):
                             didSomething = True
 
-                        else:
-                            if self._handleReadReadySocket(socketWithData):
-                                didSomething = True
-
                     socketsWithSslWantWrite = self._socketsWithSslWantWrite
                     self._socketsWithSslWantWrite.clear()
                     for writeable in socketsWithSslWantWrite:
-                        self._allSockets.discardForWrite(writeable)
-                        if self._handleWriteReadySocket(writeable):
+                        allSockets.discardForWrite(writeable)
+                        if handleWriteReadySocket(writeable):
                             didSomething = True
 
                     # if we're just spinning making no progress, don't bother
                     if selectsWithNoUpdate < 10:
                         for writeable in writeReady:
-                            if self._handleWriteReadySocket(writeable):
+                            if handleWriteReadySocket(writeable):
                                 didSomething = True
 
                     if didSomething:
@@ -850,58 +1212,108 @@ class MessageBus(object):
 
     def _handleMessageToSendWakePipe(self):
         """ Accessed by: socketThread """
-        for receivedMsgTrigger in os.read(self._messageToSendWakePipe[0], MSG_BUF_SIZE):
-            self._handleMessageToSend()
+        os.read(self._messageToSendWakePipe[0], MSG_BUF_SIZE)
+
+        # clear the flag before draining, so that anything queued after we
+        # look at the queue for the last time triggers a new wakeup.
+        with self._wakePipeLock:
+            self._messageToSendWakePending = False
+
+        self._handleControlMessages()
+
+        maxBytes = self._messagesToSendQueue.maxBytes
+
+        while maxBytes is None or self.totalBytesPendingInOutputLoop < maxBytes:
+            if not self._handleMessageToSend():
+                return
+
+        # our output buffers are full. Leave a wakeup in the pipe so we pick up
+        # the remaining messages once we're allowed to read again.
+        self._wakeForMessageToSend()
 
     def _handleEventToFireWakePipe(self):
         """ Accessed by: socketThread """
-        for receivedMsgTrigger in os.read(self._eventToFireWakePipe[0], MSG_BUF_SIZE):
-            self._handleEventToFire()
+        os.read(self._eventToFireWakePipe[0], MSG_BUF_SIZE)
+
+        with self._wakePipeLock:
+            self._eventToFireWakePending = False
+
+        while self._handleEventToFire():
+            pass
 
     def _handleGeneralWakePipe(self):
         """ Accessed by: socketThread """
         os.read(self._generalWakePipe[0], MSG_BUF_SIZE)
 
+        # the loop recomputes its timeout from the head of the callback heap
+        # after every wakeup, so there's nothing to drain beyond the flag.
+        with self._wakePipeLock:
+            self._generalWakePending = False
+
     def _handleMessageToSend(self):
+        """ Accessed by: socketThread
+
+        Returns:
+            False if the queue of messages to send was empty.
+        """
+        try:
+            connId, msg = self._messagesToSendQueue.get(timeout=0.0)
+        except queue.Empty:
+            return False
+
+        # a control message queued before this one (e.g. the TriggerConnect for its
+        # connection) may have arrived since we last looked, and must go first.
+        self._handleControlMessages()
+
+        self._scheduleBytesForWrite(connId, msg)
+
+        return True
+
+    def _handleControlMessages(self):
         """ Accessed by: socketThread """
-        connectionAndMsg = self._messagesToSendQueue.get(timeout=0.0)
+        while self._controlMessagesToSend:
+            controlMsg = self._controlMessagesToSend.popleft()
 
-        if connectionAndMsg is Disconnected or connectionAndMsg is None:
-            return
+            if controlMsg is Disconnected:
+                continue
 
-        connId, msg = connectionAndMsg
+            connId, msg = controlMsg
+            assert msg is TriggerConnect
 
-        if msg is TriggerConnect:
             # preschedule the auth token write. When we connect we'll send it
             # immediately
-            if self._authToken is not None:
-                self._scheduleBytesForWrite(connId, self._authToken.encode("utf8"))
+            if self._authTokenBytes is not None:
+                self._scheduleBytesForWrite(connId, self._authTokenBytes)
 
             # we're supposed to connect to this worker. We have to do
-            # this in a background.
-            self.scheduleCallback(lambda: self._connectTo(connId))
-
-        else:
-            self._scheduleBytesForWrite(connId, msg)
+            # this in a background. Bind 'connId' now: a closure would see
+            # whatever this loop last assigned to it by the time it runs.
+            self.scheduleCallback(functools.partial(self._connectTo, connId))
 
     def _handleEventToFire(self):
-        """ Accessed by: the socketThread """
-        # one message should be on the queue for each "E" msg trigger on the
-        # thread pipe
-        readMessage = self._eventsToFireQueue.get_nowait()
+        """ Accessed by: the socketThread
+
+        Returns:
+            False if the queue of events to fire was empty.
+        """
+        try:
+            readMessage = self._eventsToFireQueue.popleft()
+        except IndexError:
+            return False
 
         if isinstance(readMessage, tuple) and readMessage[1] is TriggerDisconnect:
             connId = readMessage[0]
-            if connId in self._connIdPendingOutgoingConnection:
-                self.scheduleCallback(lambda: self._scheduleEvent(readMessage), delay=0.1)
-                return
+            connection = self._connections.get(connId)
 
-            else:
-                if connId in self._connIdToOutgoingSocket:
-                    self._markSocketClosed(self._connIdToOutgoingSocket[connId])
+            if connection is not None and connection.isPendingOutgoingConnection:
+                self.scheduleCallback(
+                    functools.partial(self._scheduleEvent, readMessage), delay=0.1
+                )
+                return True
 
-                elif connId in self._connIdToIncomingSocket:
-                    self._markSocketClosed(self._connIdToIncomingSocket[connId])
+            else:
+                if connection is not None:
+                    self._markSocketClosed(connection.socket)
 
                 else:
                     self._logger.error(
@@ -913,7 +1325,8 @@ class MessageBus(object):
 
             if readMessage.matches.OutgoingConnectionEstablished:
                 connId = readMessage.connectionId
-                sock = self._connIdToOutgoingSocket.get(connId)
+                connection = self._connections.get(connId)
+                sock = connection.socket if connection is not None else None
                 if sock:
                     self._allSockets.addForRead(sock)
                 else:
@@ -931,6 +1344,8 @@ class MessageBus(object):
             else:
                 self._fireEvent(readMessage)
 
+        return True
+
     def _handleWriteReadySocket(self, writeable):
         """ Socket 'writeable' can accept more bytes.
 
@@ -938,11 +1353,17 @@ class MessageBus(object):
 
         Returns (bool) didSomething
         """
-        if writeable not in self._socketToBytesNeedingWrite:
+        # producers only append to an existing buffer (under the lock), so we can send
+        # from it without holding the lock and only take it to commit the result.
+        connection = self._socketToConnection.get(writeable)
+        pendingWrites = connection.pendingWrites if connection is not None else None
+
+        if pendingWrites is None:
+            self._allSockets.discardForWrite(writeable)
             return
 
         try:
-            bytesWritten = writeable.send(self._socketToBytesNeedingWrite[writeable])
+            bytesWritten = pendingWrites.sendTo(writeable)
 
         except ssl.SSLWantReadError:
             bytesWritten = -1
@@ -965,7 +1386,7 @@ class MessageBus(object):
             self._allSockets.discardForWrite(writeable)
 
             with self._lock:
-                del self._socketToBytesNeedingWrite[writeable]
+                self._dropPendingWrites(connection)
 
             return True
 
@@ -978,12 +1399,10 @@ class MessageBus(object):
                 self.totalBytesPendingInOutputLoop -= bytesWritten
                 self.totalBytesWritten += bytesWritten
 
-                self._socketToBytesNeedingWrite[writeable][:bytesWritten] = b""
-
-                if not self._socketToBytesNeedingWrite[writeable]:
+                if not pendingWrites:
                     # we have no bytes to flush
                     self._allSockets.discardForWrite(writeable)
-                    del self._socketToBytesNeedingWrite[writeable]
+                    self._dropPendingWrites(connection)
 
             return True
 
@@ -1003,27 +1422,21 @@ class MessageBus(object):
         toFire = []
 
         with self._lock:
-            if socket in self._socketToIncomingConnId:
-                connId = self._socketToIncomingConnId[socket]
-                self._unauthenticatedConnections.discard(connId)
-                del self._connIdToIncomingSocket[connId]
-                del self._socketToIncomingConnId[socket]
-                del self._connIdToIncomingEndpoint[connId]
-                del self._incomingSocketBuffers[socket]
-                if socket in self._socketToBytesNeedingWrite:
-                    del self._socketToBytesNeedingWrite[socket]
-                toFire.append(self.eventType.IncomingConnectionClosed(connectionId=connId))
-
-            elif socket in self._socketToOutgoingConnId:
-                connId = self._socketToOutgoingConnId[socket]
-                del self._connIdToOutgoingEndpoint[connId]
-
-                del self._socketToOutgoingConnId[socket]
-                del self._connIdToOutgoingSocket[connId]
-                del self._incomingSocketBuffers[socket]
-                if socket in self._socketToBytesNeedingWrite:
-                    del self._socketToBytesNeedingWrite[socket]
-                toFire.append(self.eventType.OutgoingConnectionClosed(connectionId=connId))
+            connection = self._socketToConnection.pop(socket, None)
+
+            if connection is not None:
+                connId = connection.connectionId
+                del self._connections[connId]
+                self._dropPendingWrites(connection)
+                self._recycleMessageBuffer(connection)
+
+                if connection.isIncoming:
+                    toFire.append(self.eventType.IncomingConnectionClosed(connectionId=connId))
+                else:
+                    toFire.append(self.eventType.OutgoingConnectionClosed(connectionId=connId))
+
+                    if isinstance(socket, ssl.SSLSocket) and socket.session is not None:
+                        self._rememberSslSession(connection.endpoint, socket.session)
 
         self._ensureSocketClosed(socket)
         self._allSockets.discard(socket)
@@ -1031,61 +1444,90 @@ class MessageBus(object):
         for event in toFire:
             self._fireEvent(event)
 
+    def _newMessageBuffer(self):
+        """ Accessed by: socketThread and eventThread, under self._lock """
+        if self._spareReceiveBuffers:
+            return MessageBuffer(self.extraMessageSizeCheck, self._spareReceiveBuffers.pop())
+
+        return MessageBuffer(self.extraMessageSizeCheck)
+
+    def _recycleMessageBuffer(self, connection):
+        """ Accessed by: socketThread and eventThread, under self._lock """
+        if connection.messageBuffer is not None:
+            self._spareReceiveBuffers.append(connection.messageBuffer.releaseStorage())
+            connection.messageBuffer = None
+
     def isUnauthenticated(self, connId):
         with self._lock:
-            return connId in self._unauthenticatedConnections
+            connection = self._connections.get(connId)
+            return connection is not None and connection.isUnauthenticated
 
-    def _getConnectionIdFromSocket(self, socket):
+    def _handleIncomingMessage(self, serializedMessage, connection):
         """ Accessed by: socketThread """
-        if socket in self._socketToIncomingConnId:
-            return self._socketToIncomingConnId[socket]
-        elif socket in self._socketToOutgoingConnId:
-            return self._socketToOutgoingConnId[socket]
+        connId = connection.connectionId
+
+        if connection.isUnauthenticated:
+            if serializedMessage != self._authTokenBytes:
+                self._logger.error("Unauthorized socket connected to us.")
+                return False
+
+            connection.isUnauthenticated = False
+            self._logger.debug(f"Connection {connId} authenticated successfully.")
+            return True
         else:
-            return None
+            # deserialization happens on the eventThread, so that a large message
+            # doesn't hold up IO on every other connection. The eventThread handles
+            # everything in order, so messages still arrive in the order we read them.
+            self._eventQueue.put((connection, serializedMessage))
 
-    def _handleIncomingMessage(self, serializedMessage, socket):
-        """ Accessed by: socketThread """
-        connId = self._getConnectionIdFromSocket(socket)
-        if connId is None:
-            return False
+            return True
 
-        if connId in self._unauthenticatedConnections:
-            try:
-                if serializedMessage.decode("utf8") != self._authToken:
-                    self._logger.error("Unauthorized socket connected to us.")
-                    return False
+    def _fireIncomingMessage(self, connection, serializedMessage):
+        """ Accessed by: eventThread """
+        if connection.failedToDeserialize:
+            return
 
-                self._unauthenticatedConnections.discard(connId)
-                self._logger.debug(f"Connection {connId} authenticated successfully.")
-                return True
+        try:
+            if self.serializationContext is None:
+                message = deserialize(self.inMessageType, serializedMessage)
+            else:
+                message = self.serializationContext.deserialize(
+                    serializedMessage, self.inMessageType
+                )
+        except Exception:
+            if serializedMessage != self._authTokenBytes:
+                self._logger.exception("Failed to deserialize a message")
 
-            except Exception:
-                self._logger.exception("Failed to read incoming auth message for %s", connId)
-                return False
-        else:
-            try:
-                if self.serializationContext is None:
-                    message = deserialize(self.inMessageType, serializedMessage)
-                else:
-                    message = self.serializationContext.deserialize(
-                        serializedMessage, self.inMessageType
-                    )
-            except Exception:
-                if serializedMessage != self._authToken:
-                    self._logger.exception("Failed to deserialize a message")
-                return False
+            connection.failedToDeserialize = True
+            self.closeConnection(connection.connectionId)
+            return
 
-            self._fireEvent(
-                self.eventType.IncomingMessage(connectionId=connId, message=message)
+        try:
+            self.onEvent(
+                self.eventType.IncomingMessage(
+                    connectionId=connection.connectionId, message=message
+                )
             )
-
-            return True
+        except Exception:
+            self._logger.exception("Message callback threw unexpected exception")
 
     def _fireEvent(self, event):
         """ Accessed by: the socketThread """
         self._eventQueue.put(event)
 
+    def _rememberSslSession(self, endpoint, session):
+        """ Keep 'session' to resume our next connection to 'endpoint'.
+
+        Must be called under self._lock.
+        """
+        sessions = self._sslSessionsByEndpoint
+
+        sessions[endpoint] = session
+        sessions.move_to_end(endpoint)
+
+        while len(sessions) > MAX_SSL_SESSIONS:
+            sessions.popitem(last=False)
+
     def _connectTo(self, connId: ConnectionId):
         """Actually form an outgoing connection.
 
@@ -1095,30 +1537,33 @@ class MessageBus(object):
 
         Accessed by: eventThread
         """
+        endpoint = None
+
         try:
-            endpoint = self._connIdToOutgoingEndpoint[connId]
+            connection = self._connections[connId]
+            endpoint = connection.endpoint
 
             naked_socket = socket.create_connection((endpoint.host, endpoint.port))
+            naked_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
 
             if self._wantsSSL:
-                sock = self._sslContext.wrap_socket(naked_socket)
+                sock = self._sslContext.wrap_socket(
+                    naked_socket, session=self._sslSessionsByEndpoint.get(endpoint)
+                )
             else:
                 sock = naked_socket
 
             sock.setblocking(False)
 
             with self._lock:
-                self._socketToOutgoingConnId[sock] = connId
-                self._connIdToOutgoingSocket[connId] = sock
-                self._incomingSocketBuffers[sock] = MessageBuffer(self.extraMessageSizeCheck)
+                connection.socket = sock
+                connection.messageBuffer = self._newMessageBuffer()
+                self._socketToConnection[sock] = connection
 
-                if connId in self._messagesForUnconnectedOutgoingConnection:
-                    messages = self._messagesForUnconnectedOutgoingConnection.pop(connId)
+                for msgBytes in connection.messagesForUnconnectedSocket:
+                    self._queueBytesForConnection(connection, msgBytes)
 
-                    for m in messages:
-                        self._scheduleBytesForWrite(connId, m)
-
-                self._connIdPendingOutgoingConnection.discard(connId)
+                connection.messagesForUnconnectedSocket = []
 
             # this message notifies the socket loop that it needs to pay attention to this
             # connection.
@@ -1130,21 +1575,17 @@ class MessageBus(object):
             self._logger.debug(f"Failed to Connect to {endpoint}: {str(e)}")
             # we failed to connect. cleanup after ourselves.
             with self._lock:
-                if connId in self._connIdToOutgoingEndpoint:
-                    del self._connIdToOutgoingEndpoint[connId]
-
-                self._connIdPendingOutgoingConnection.discard(connId)
+                connection = self._connections.pop(connId, None)
 
-                if connId in self._messagesForUnconnectedOutgoingConnection:
-                    del self._messagesForUnconnectedOutgoingConnection[connId]
+                # don't hold on to a session for an endpoint we can't reach. If it
+                # was the resumption itself that failed, we start fresh next time.
+                if endpoint is not None:
+                    self._sslSessionsByEndpoint.pop(endpoint, None)
 
-                if connId in self._connIdToOutgoingSocket:
-                    sock = self._connIdToOutgoingSocket.pop(connId)
-                    del self._socketToOutgoingConnId[sock]
-                    del self._connIdToOutgoingSocket[connId]
-                    del self._incomingSocketBuffers[sock]
-                    if sock in self._socketToBytesNeedingWrite:
-                        del self._socketToBytesNeedingWrite[sock]
+                if connection is not None and connection.socket is not None:
+                    del self._socketToConnection[connection.socket]
+                    self._dropPendingWrites(connection)
+                    self._recycleMessageBuffer(connection)
 
             self._scheduleEvent(self.eventType.OutgoingConnectionFailed(connectionId=connId))
 
@@ -1159,20 +1600,22 @@ class MessageBus(object):
 
         Accessed by: the socketThread
         """
+        # sample the clock once. Anything that comes due while we're draining
+        # gets picked up on the next pass through the socket loop.
+        t0 = time.monotonic()
+
         with self._lock:
-            while True:
-                t0 = time.time()
+            pendingTimedCallbacks = self._pendingTimedCallbacks
 
-                if self._pendingTimedCallbacks and self._pendingTimedCallbacks[0][0] <= t0:
-                    _, callback = self._pendingTimedCallbacks.pop(0)
-                    if callback is not None:
-                        self._eventQueue.put(callback)
+            while pendingTimedCallbacks and pendingTimedCallbacks[0][0] <= t0:
+                _, _, callback = heapq.heappop(pendingTimedCallbacks)
+                if callback is not None:
+                    self._eventQueue.put(callback)
 
-                elif self._pendingTimedCallbacks:
-                    return max(self._pendingTimedCallbacks[0][0] - t0, 0.0)
+            if pendingTimedCallbacks:
+                return max(pendingTimedCallbacks[0][0] - t0, 0.0)
 
-                else:
-                    return None
+            return None
 
     def _eventThreadLoop(self):
         while True:
@@ -1185,6 +1628,8 @@ class MessageBus(object):
                     self.onEvent(msg)
                 except Exception:
                     self._logger.exception("Message callback threw unexpected exception")
+            elif isinstance(msg, tuple):
+                self._fireIncomingMessage(*msg)
             else:
                 try:
                     msg()
@@ -12,10 +12,12 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import concurrent.futures
 import os
 import pytest
 import queue
 import resource
+import select
 import socket
 import ssl
 import struct
@@ -24,7 +26,14 @@ import time
 import unittest
 
 from flaky import flaky
-from object_database.message_bus import MessageBus
+from object_database.message_bus import (
+    MAX_SSL_SESSIONS,
+    MSG_BUF_SIZE,
+    CorruptMessageStream,
+    MessageBuffer,
+    MessageBus,
+    PendingWriteBuffer,
+)
 from object_database.bytecount_limited_queue import BytecountLimitedQueue
 
 
@@ -34,15 +43,18 @@ TIMEOUT = 5.0
 def waitUntil(predicate, *, timeout=10.0):
     """ Returns True if the predicate became True within timeout secounds. """
     t0 = time.time()
+    sleepTime = 0.01
     while time.time() - t0 < timeout:
         if predicate():
             return True
-        time.sleep(0.1)
+        time.sleep(sleepTime)
+        sleepTime = min(sleepTime * 2, 0.1)
     return False
 
 
 def numFds():
-    return len(os.listdir(f"/proc/{os.getpid()}/fd"))
+    with os.scandir("/proc/self/fd") as entries:
+        return sum(1 for _ in entries)
 
 
 class TestMessageBus(unittest.TestCase):
@@ -88,25 +100,23 @@ class TestMessageBus(unittest.TestCase):
         initialFdCount = numFds()
         print("initial FD count =", initialFdCount)
 
-        assert waitUntil(lambda: self.messageQueue1.qsize() == 1, timeout=1.0)
-        self.messageQueue1.get()
-
-        assert waitUntil(lambda: self.messageQueue2.qsize() == 2, timeout=1.0)
+        self.messageQueue1.get(timeout=1.0)
 
-        def findSentMessage(match):
-            try:
-                msg = self.messageQueue2.get(timeout=0.0)
+        def findSentMessage(match, timeout):
+            """ Drain messageQueue2 until we see an IncomingMessage of 'match'. """
+            t0 = time.time()
 
-            except queue.Empty:
-                return False
+            while True:
+                try:
+                    msg = self.messageQueue2.get(timeout=max(t0 + timeout - time.time(), 0.0))
 
-            else:
-                if hasattr(msg, "message"):
-                    return msg.message == match
-                else:
+                except queue.Empty:
                     return False
 
-        assert waitUntil(lambda: findSentMessage(self.messageBus1.busIdentity), timeout=1.0)
+                if hasattr(msg, "message") and msg.message == match:
+                    return True
+
+        assert findSentMessage(self.messageBus1.busIdentity, timeout=2.0)
         assert self.messageQueue2.qsize() == 0
 
         softLimit, hardLimit = resource.getrlimit(resource.RLIMIT_NOFILE)
@@ -136,15 +146,10 @@ class TestMessageBus(unittest.TestCase):
 
             # Existing connections should still work
             self.messageBus1.sendMessage(connId, self.messageBus1.busIdentity)
-            assert waitUntil(
-                lambda: self.messageQueue2.qsize() >= 1, timeout=1.0
-            ), f"Messge queue size after timeout = {self.messageQueue2.qsize()}"
 
             assert self.messageBus1.busIdentity is not None
 
-            assert waitUntil(
-                lambda: findSentMessage(self.messageBus1.busIdentity), timeout=2.5
-            )
+            assert findSentMessage(self.messageBus1.busIdentity, timeout=3.5)
 
         finally:
             # restore limits
@@ -189,28 +194,45 @@ class TestMessageBus(unittest.TestCase):
             resource.setrlimit(resource.RLIMIT_NOFILE, (softLimit, hardLimit))
 
     def test_starting_and_stopping(self):
-        for _ in range(100):
-            messageBus3 = MessageBus(
-                "bus3",
-                ("localhost", 8003),
-                str,
-                str,
-                self.messageQueue1.put,
-                None,
-                None,
-                "testcert.cert",
-            )
-            messageBus3.start()
-            messageBus3.stop(timeout=TIMEOUT)
+        # each worker repeatedly starts and stops a bus on its own port, so we
+        # still check that a stopped bus releases its port, but the 100 bus
+        # lifecycles overlap instead of running one after another.
+        workerCount = 10
+
+        def startAndStop(workerIx):
+            for _ in range(100 // workerCount):
+                messageBus3 = MessageBus(
+                    f"bus3_{workerIx}",
+                    ("localhost", 8003 + workerIx),
+                    str,
+                    str,
+                    self.messageQueue1.put,
+                    None,
+                    None,
+                    "testcert.cert",
+                )
+                messageBus3.start()
+                messageBus3.stop(timeout=TIMEOUT)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workerCount) as executor:
+            # list() so that any worker's exception is raised here
+            list(executor.map(startAndStop, range(workerCount)))
 
     def test_socket_loop_doesnt_quit(self):
-        self.messageBus1._socketToBytesNeedingWrite[0.0] = bytearray()  # wrong kind of key
+        # register a bogus pending write the way _queueBytesForConnection would, and
+        # wake the socket loop so it tries to watch 0.0 for writes and throws.
+        with self.messageBus1._lock:
+            self.messageBus1._socketsWithPendingWrites.add(0.0)  # wrong kind of socket
+            self.messageBus1._socketsWithNewPendingWrites.append(0.0)
+        os.write(self.messageBus1._generalWakePipe[1], b" ")
+
         time.sleep(1.0)
         connId = self.messageBus1.connect(("localhost", 8001))
         self.messageBus1.sendMessage(connId, "Msg")
 
         time.sleep(1.0)
-        del self.messageBus1._socketToBytesNeedingWrite[0.0]
+        with self.messageBus1._lock:
+            self.messageBus1._socketsWithPendingWrites.discard(0.0)
 
         assert self.messageQueue1.get(timeout=TIMEOUT).matches.OutgoingConnectionEstablished
         assert self.messageQueue2.get(timeout=TIMEOUT).matches.NewIncomingConnection
@@ -292,7 +314,10 @@ class TestMessageBus(unittest.TestCase):
             assert self.messageQueue1.get(timeout=TIMEOUT).matches.OutgoingConnectionClosed
             assert self.messageQueue2.get(timeout=TIMEOUT).matches.IncomingConnectionClosed
 
-        assert len(self.messageBus1._connIdPendingOutgoingConnection) == 0
+        assert not any(
+            connection.isPendingOutgoingConnection
+            for connection in self.messageBus1._connections.values()
+        )
 
     def test_closing_incoming(self):
         self.messageBus1.connect(("localhost", 8001))
@@ -547,9 +572,12 @@ class TestMessageBus(unittest.TestCase):
 
         writeCount = [0]
 
+        # the buses carry str messages, so build the (immutable) payload just once
+        message = " " * 1024 * 700
+
         def writeThread():
             while writeCount[0] < 1000:
-                self.messageBus1.sendMessage(conn1, " " * 1024 * 700)
+                self.messageBus1.sendMessage(conn1, message)
 
                 writeCount[0] += 1
 
@@ -582,3 +610,176 @@ class TestMessageBus(unittest.TestCase):
         msg = self.messageQueue2.get()
         assert msg.matches.IncomingMessage
         assert msg.message == "asdf"
+
+    def test_connections_disable_nagle(self):
+        outgoingConnId = self.messageBus1.connect(self.messageBus2.listeningEndpoint)
+        assert self.messageQueue1.get(timeout=TIMEOUT).matches.OutgoingConnectionEstablished
+
+        event = self.messageQueue2.get(timeout=TIMEOUT)
+        assert event.matches.NewIncomingConnection
+
+        for bus, connId in [
+            (self.messageBus1, outgoingConnId),
+            (self.messageBus2, event.connectionId),
+        ]:
+            sock = bus._connections[connId].socket
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+    def test_reconnect_resumes_tls_session(self):
+        endpoint = self.messageBus2.listeningEndpoint
+
+        for attempt in range(3):
+            connId = self.messageBus1.connect(endpoint)
+            self.messageBus1.sendMessage(connId, "hi")
+
+            event = self.messageQueue1.get(timeout=TIMEOUT)
+            assert event.matches.OutgoingConnectionEstablished
+            assert self.messageQueue2.get(timeout=TIMEOUT).matches.NewIncomingConnection
+            assert self.messageQueue2.get(timeout=TIMEOUT).message == "hi"
+
+            # only the first connection has no session to resume
+            assert self.messageBus1._connections[connId].socket.session_reused == (attempt > 0)
+
+            self.messageBus1.closeConnection(connId)
+            assert self.messageQueue1.get(timeout=TIMEOUT).matches.OutgoingConnectionClosed
+            assert self.messageQueue2.get(timeout=TIMEOUT).matches.IncomingConnectionClosed
+
+            assert endpoint in self.messageBus1._sslSessionsByEndpoint
+
+        # a failed connect forgets the endpoint's session
+        self.messageBus2.stop(timeout=TIMEOUT)
+
+        self.messageBus1.connect(endpoint)
+        assert self.messageQueue1.get(timeout=TIMEOUT).matches.OutgoingConnectionFailed
+        assert endpoint not in self.messageBus1._sslSessionsByEndpoint
+
+    def test_remembered_tls_sessions_are_bounded(self):
+        with self.messageBus1._lock:
+            for port in range(MAX_SSL_SESSIONS + 10):
+                self.messageBus1._rememberSslSession(("localhost", port), object())
+
+            sessions = self.messageBus1._sslSessionsByEndpoint
+            assert len(sessions) == MAX_SSL_SESSIONS
+            assert ("localhost", 9) not in sessions
+            assert ("localhost", MAX_SSL_SESSIONS + 9) in sessions
+
+
+class TestPendingWriteBuffer(unittest.TestCase):
+    def test_pending_write_buffer_preserves_byte_order(self):
+        writer, reader = socket.socketpair()
+
+        try:
+            writer.setblocking(False)
+            writer.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+            reader.setblocking(False)
+
+            chunks = [bytearray([i % 256]) * (i * 37 % 5000 + 1) for i in range(200)]
+            expected = b"".join(chunks)
+
+            pendingWrites = PendingWriteBuffer()
+            for chunk in chunks:
+                pendingWrites.append(chunk)
+
+            received = bytearray()
+
+            # fail (rather than hang) if neither side moves any bytes for TIMEOUT seconds
+            deadline = time.time() + TIMEOUT
+
+            while pendingWrites or len(received) < len(expected):
+                if time.time() > deadline:
+                    self.fail(
+                        f"No progress within {TIMEOUT} seconds: received {len(received)} "
+                        f"of {len(expected)} bytes"
+                    )
+
+                readable, writeable, _ = select.select(
+                    [reader], [writer] if pendingWrites else [], [], deadline - time.time()
+                )
+
+                if writeable and pendingWrites.sendTo(writer) > 0:
+                    deadline = time.time() + TIMEOUT
+
+                if readable:
+                    data = reader.recv(MSG_BUF_SIZE)
+                    if data:
+                        received.extend(data)
+                        deadline = time.time() + TIMEOUT
+
+            self.assertEqual(received, expected)
+        finally:
+            writer.close()
+            reader.close()
+
+
+class TestMessageBuffer(unittest.TestCase):
+    def test_message_buffer_handles_frames_split_anywhere(self):
+        messages = [b"", b"a", b"hello", bytes(range(256)) * 3]
+
+        for extraMessageSizeCheck in [False, True]:
+            stream = b"".join(
+                MessageBuffer.encode(msg, extraMessageSizeCheck) for msg in messages
+            )
+
+            for splitPoint in range(len(stream) + 1):
+                buf = MessageBuffer(extraMessageSizeCheck)
+
+                received = buf.write(stream[:splitPoint])
+                received += buf.write(stream[splitPoint:])
+
+                self.assertEqual(received, messages, (extraMessageSizeCheck, splitPoint))
+                self.assertEqual(buf.pendingBytecount(), 0)
+
+    def test_message_buffer_detects_corrupt_size_check(self):
+        buf = MessageBuffer(True)
+
+        frame = bytearray(MessageBuffer.encode(b"hello", True))
+        struct.pack_into("i", frame, len(frame) - 4, 4)
+
+        with self.assertRaises(CorruptMessageStream):
+            buf.write(frame)
+
+    def test_message_buffer_trims_after_large_message(self):
+        buf = MessageBuffer(False)
+
+        msg = os.urandom(3 * MessageBuffer.MAX_IDLE_CAPACITY)
+        frame = MessageBuffer.encode(msg, False)
+
+        # hold back the final byte so the message stays incomplete
+        head = frame[:-1]
+
+        for offset in range(0, len(head), MSG_BUF_SIZE):
+            self.assertEqual(buf.write(head[offset : offset + MSG_BUF_SIZE]), [])
+
+        self.assertGreater(len(buf.buffer), MessageBuffer.MAX_IDLE_CAPACITY)
+
+        self.assertEqual(buf.write(frame[-1:]), [msg])
+        self.assertEqual(buf.pendingBytecount(), 0)
+        self.assertLessEqual(len(buf.buffer), MessageBuffer.MAX_IDLE_CAPACITY)
+
+    def test_message_buffer_reuses_recycled_storage(self):
+        # leave a partial message behind, so the recycled storage isn't empty
+        oldBuf = MessageBuffer(False)
+        self.assertEqual(oldBuf.write(MessageBuffer.encode(b"x" * 1000, False)[:500]), [])
+
+        storage = oldBuf.releaseStorage()
+        self.assertTrue(storage)
+
+        buf = MessageBuffer(False, storage=storage)
+        self.assertEqual(buf.pendingBytecount(), 0)
+
+        writer, reader = socket.socketpair()
+
+        try:
+            messages = [b"hello", b"world" * 100]
+            writer.sendall(b"".join(MessageBuffer.encode(msg, False) for msg in messages))
+            writer.close()
+
+            received = []
+            while buf.receiveFrom(reader):
+                received.extend(buf.readMessages())
+
+            self.assertEqual(received, messages)
+            self.assertIs(buf.buffer, storage)
+        finally:
+            writer.close()
+            reader.close()
@@ -8,75 +8,114 @@ from object_database.schema import (
     FieldDefinition,
 )
 
-_heartbeatInterval = [5.0]
+_heartbeatInterval = 5.0
 
 
 def setHeartbeatInterval(newInterval):
-    _heartbeatInterval[0] = newInterval
+    global _heartbeatInterval
+    _heartbeatInterval = newInterval
 
 
 def getHeartbeatInterval():
-    return _heartbeatInterval[0]
+    return _heartbeatInterval
 
 
-def MessageToStr(msg):
-    fields = {}
+# if False, MessageToStr renders only the alternative's name and skips formatting
+# its fields. Useful when messages get stringified in bulk, e.g. by a trace.
+_messageStrIsVerbose = True
+
+
+def setMessageStrVerbose(isVerbose):
+    global _messageStrIsVerbose
+    _messageStrIsVerbose = isVerbose
+
+
+def getMessageStrVerbose():
+    return _messageStrIsVerbose
 
-    if hasattr(msg, "schema"):
-        fields["schema"] = msg.schema
 
-    if hasattr(msg, "name"):
-        fields["name"] = msg.name
+def _clip(x):
+    stringified = repr(x)
+    if len(stringified) > 20:
+        stringified = stringified[:20] + stringified[0]
+    return stringified
 
-    if hasattr(msg, "typename"):
-        fields["typename"] = msg.typename
 
-    if hasattr(msg, "transaction_id"):
-        fields["transaction_id"] = msg.transaction_id
+def _formatFieldnameAndValue(msg):
+    if msg.fieldname_and_value is None:
+        return None
 
-    if hasattr(msg, "writes"):
-        fields["writes"] = f"#{len(msg.writes)}"
+    return f"({msg.fieldname_and_value[0]}, {_clip(msg.fieldname_and_value[1])})"
 
-    if hasattr(msg, "set_adds"):
-        fields["set_adds"] = f"#{len(msg.set_adds)}"
 
-    if hasattr(msg, "set_removes"):
-        fields["set_removes"] = f"#{len(msg.set_removes)}"
+# (fieldName, formatter) for every field MessageToStr knows how to show, in the order
+# it shows them. A formatter returns None if the field should be left out.
+_FIELD_FORMATTERS = [
+    ("schema", lambda msg: f"{msg.schema}"),
+    ("name", lambda msg: f"{msg.name}"),
+    ("typename", lambda msg: f"{msg.typename}"),
+    ("transaction_id", lambda msg: f"{msg.transaction_id}"),
+    ("writes", lambda msg: f"#{len(msg.writes)}"),
+    ("set_adds", lambda msg: f"#{len(msg.set_adds)}"),
+    ("set_removes", lambda msg: f"#{len(msg.set_removes)}"),
+    ("mapping", lambda msg: f"#{len(msg.mapping)}"),
+    ("identities", lambda msg: f"#{len(msg.identities)}" if msg.identities else None),
+    ("fieldname_and_value", _formatFieldnameAndValue),
+    ("transaction_guid", lambda msg: f"{msg.transaction_guid}"),
+    ("success", lambda msg: f"{msg.success}"),
+    ("values", lambda msg: f"#{len(msg.values)}"),
+    ("tid", lambda msg: f"{msg.tid}"),
+    ("index_values", lambda msg: f"#{len(msg.index_values)}"),
+]
 
-    if hasattr(msg, "mapping"):
-        fields["mapping"] = f"#{len(msg.mapping)}"
+# concrete alternative type -> (its name, the subset of _FIELD_FORMATTERS it has).
+# Filled in by _registerFormatters once the message Alternatives below are defined,
+# so we don't have to probe every field with 'hasattr' each time we stringify a message.
+_formattersForType = {}
 
-    if hasattr(msg, "identities") and msg.identities:
-        fields["identities"] = f"#{len(msg.identities)}"
 
-    if hasattr(msg, "fieldname_and_value") and msg.fieldname_and_value is not None:
+def _registerFormatters(alternativeType):
+    for concreteType in alternativeType.__typed_python_alternatives__:
+        fieldNames = set(concreteType.ElementType.ElementNames)
 
-        def clip(x):
-            stringified = repr(x)
-            if len(stringified) > 20:
-                stringified = stringified[:20] + stringified[0]
-            return stringified
+        _formattersForType[concreteType] = (
+            concreteType.__name__,
+            [
+                (fieldName, formatter)
+                for fieldName, formatter in _FIELD_FORMATTERS
+                if fieldName in fieldNames
+            ],
+        )
 
-        fields[
-            "fieldname_and_value"
-        ] = f"({msg.fieldname_and_value[0]}, {clip(msg.fieldname_and_value[1])})"
 
-    if hasattr(msg, "transaction_guid"):
-        fields["transaction_guid"] = f"{msg.transaction_guid}"
+def MessageToStr(msg):
+    nameAndFormatters = _formattersForType.get(type(msg))
+
+    if nameAndFormatters is not None:
+        typeName, formatters = nameAndFormatters
+    else:
+        typeName = type(msg).__name__
+        formatters = None
+
+    if not _messageStrIsVerbose:
+        return typeName
 
-    if hasattr(msg, "success"):
-        fields["success"] = f"{msg.success}"
+    if formatters is None:
+        formatters = [
+            (fieldName, formatter)
+            for fieldName, formatter in _FIELD_FORMATTERS
+            if hasattr(msg, fieldName)
+        ]
 
-    if hasattr(msg, "values"):
-        fields["values"] = f"#{len(msg.values)}"
+    fields = []
 
-    if hasattr(msg, "tid"):
-        fields["tid"] = msg.tid
+    for fieldName, formatter in formatters:
+        value = formatter(msg)
 
-    if hasattr(msg, "index_values"):
-        fields["index_values"] = f"#{len(msg.index_values)}"
+        if value is not None:
+            fields.append(f"{fieldName}={value}")
 
-    return type(msg).__name__ + "(" + ", ".join([f"{k}={v}" for k, v in fields.items()]) + ")"
+    return typeName + "(" + ", ".join(fields) + ")"
 
 
 ClientToServer = Alternative(
@@ -224,3 +263,7 @@ ServerToClient = Alternative(
     DependentConnectionId={"guid": str, "connIdentity": ObjectId, "identity_root": int},
     __str__=MessageToStr,
 )
+
+
+_registerFormatters(ClientToServer)
+_registerFormatters(ServerToClient)
@@ -0,0 +1,158 @@
+#   Copyright 2017-2019 object_database Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+
+from object_database.messages import (
+    ClientToServer,
+    ServerToClient,
+    getMessageStrVerbose,
+    setMessageStrVerbose,
+)
+from object_database.schema import IndexId, ObjectFieldId
+
+
+def hasattrMessageToStr(msg):
+    """ MessageToStr as it was before it precomputed each alternative's fields. """
+    fields = {}
+
+    if hasattr(msg, "schema"):
+        fields["schema"] = msg.schema
+
+    if hasattr(msg, "name"):
+        fields["name"] = msg.name
+
+    if hasattr(msg, "typename"):
+        fields["typename"] = msg.typename
+
+    if hasattr(msg, "transaction_id"):
+        fields["transaction_id"] = msg.transaction_id
+
+    if hasattr(msg, "writes"):
+        fields["writes"] = f"#{len(msg.writes)}"
+
+    if hasattr(msg, "set_adds"):
+        fields["set_adds"] = f"#{len(msg.set_adds)}"
+
+    if hasattr(msg, "set_removes"):
+        fields["set_removes"] = f"#{len(msg.set_removes)}"
+
+    if hasattr(msg, "mapping"):
+        fields["mapping"] = f"#{len(msg.mapping)}"
+
+    if hasattr(msg, "identities") and msg.identities:
+        fields["identities"] = f"#{len(msg.identities)}"
+
+    if hasattr(msg, "fieldname_and_value") and msg.fieldname_and_value is not None:
+
+        def clip(x):
+            stringified = repr(x)
+            if len(stringified) > 20:
+                stringified = stringified[:20] + stringified[0]
+            return stringified
+
+        fields[
+            "fieldname_and_value"
+        ] = f"({msg.fieldname_and_value[0]}, {clip(msg.fieldname_and_value[1])})"
+
+    if hasattr(msg, "transaction_guid"):
+        fields["transaction_guid"] = f"{msg.transaction_guid}"
+
+    if hasattr(msg, "success"):
+        fields["success"] = f"{msg.success}"
+
+    if hasattr(msg, "values"):
+        fields["values"] = f"#{len(msg.values)}"
+
+    if hasattr(msg, "tid"):
+        fields["tid"] = msg.tid
+
+    if hasattr(msg, "index_values"):
+        fields["index_values"] = f"#{len(msg.index_values)}"
+
+    return type(msg).__name__ + "(" + ", ".join([f"{k}={v}" for k, v in fields.items()]) + ")"
+
+
+def sampleMessages():
+    objectField = ObjectFieldId(objId=10, fieldId=2, isIndexValue=False)
+    indexId = IndexId(fieldId=3, indexValue=b"v")
+
+    return [
+        ClientToServer.Subscribe(
+            schema="schema", typename="T", fieldname_and_value=None, isLazy=False
+        ),
+        ClientToServer.Subscribe(
+            schema="schema",
+            typename="T",
+            fieldname_and_value=("name", b"a value long enough to get clipped"),
+            isLazy=True,
+        ),
+        ClientToServer.TransactionData(
+            writes={objectField: b"x"},
+            set_adds={indexId: (10, 11)},
+            set_removes={},
+            key_versions=(),
+            index_versions=(),
+            transaction_guid=7,
+        ),
+        ClientToServer.Heartbeat(),
+        ServerToClient.TransactionResult(transaction_guid=7, success=True, badKey=None),
+        ServerToClient.SubscriptionData(
+            schema="schema",
+            typename=None,
+            fieldname_and_value=None,
+            values={objectField: None},
+            index_values={},
+            identities=None,
+        ),
+        ServerToClient.SubscriptionIncrease(
+            schema="schema",
+            typename="T",
+            fieldname_and_value=("name", b"v"),
+            identities=(10, 11, 12),
+            transaction_id=3,
+        ),
+    ]
+
+
+class MessageToStrTest(unittest.TestCase):
+    def setUp(self):
+        self.wasVerbose = getMessageStrVerbose()
+
+    def tearDown(self):
+        setMessageStrVerbose(self.wasVerbose)
+
+    def test_verbose_str(self):
+        setMessageStrVerbose(True)
+
+        msg = ClientToServer.Subscribe(
+            schema="schema", typename="T", fieldname_and_value=None, isLazy=False
+        )
+
+        self.assertEqual(str(msg), type(msg).__name__ + "(schema=schema, typename=T)")
+
+    def test_terse_str(self):
+        setMessageStrVerbose(False)
+
+        msg = ClientToServer.Subscribe(
+            schema="schema", typename="T", fieldname_and_value=None, isLazy=False
+        )
+
+        self.assertEqual(str(msg), type(msg).__name__)
+
+    def test_verbose_str_matches_hasattr_formatting(self):
+        setMessageStrVerbose(True)
+
+        for msg in sampleMessages():
+            self.assertEqual(str(msg), hasattrMessageToStr(msg))
@@ -9,7 +9,8 @@ class SocketWatcher:
         self._logger = logging.getLogger(__name__)
         self._epoll = select.epoll()
 
-        #  _sockets: dict(sockOrFd -> tuple(fd: int, canRead: bool, canWrite: bool))
+        #  _sockets: dict(sockOrFd -> tuple(fd: int, mask: int)), where 'mask' is the
+        #  epoll event mask we registered the fd with.
         self._sockets = {}
 
         # _fdToSocketObj: dict(fd: int -> sockOrFd)
@@ -30,16 +31,16 @@ class SocketWatcher:
 
     def canRead(self, sockOrFd) -> bool:
         if sockOrFd in self._sockets:
-            fd, canRead, canWrite = self._sockets[sockOrFd]
-            return canRead
+            fd, mask = self._sockets[sockOrFd]
+            return bool(mask & select.EPOLLIN)
 
         else:
             return False
 
     def canWrite(self, sockOrFd) -> bool:
         if sockOrFd in self._sockets:
-            fd, canRead, canWrite = self._sockets[sockOrFd]
-            return canWrite
+            fd, mask = self._sockets[sockOrFd]
+            return bool(mask & select.EPOLLOUT)
 
         else:
             return False
@@ -71,9 +72,12 @@ class SocketWatcher:
 
             return False
 
-        if sockOrFd not in self._sockets:
+        addMask = self.eventMask(addRead, addWrite)
+        current = self._sockets.get(sockOrFd)
+
+        if current is None:
             try:
-                self._epoll.register(fd, self.eventMask(addRead, addWrite))
+                self._epoll.register(fd, addMask)
 
             except Exception as e:
                 self._logger.error(
@@ -82,12 +86,12 @@ class SocketWatcher:
                 return False
 
             else:
-                self._sockets[sockOrFd] = (fd, addRead, addWrite)
+                self._sockets[sockOrFd] = (fd, addMask)
                 self._fdToSocketObj[fd] = sockOrFd
                 return True
 
         else:
-            currFd, currRead, currWrite = self._sockets[sockOrFd]
+            currFd, currMask = current
 
             if fd != currFd:
                 self.discard(sockOrFd, True, True)
@@ -95,19 +99,18 @@ class SocketWatcher:
 
             else:
                 # we may be adding read or write to a socket
-                forRead = addRead or currRead
-                forWrite = addWrite or currWrite
+                newMask = currMask | addMask
 
-                if currRead != forRead or currWrite != forWrite:
+                if newMask != currMask:
                     try:
-                        self._epoll.modify(fd, self.eventMask(forRead, forWrite))
+                        self._epoll.modify(fd, newMask)
 
                     except Exception:
                         self._logger.error(f"Failed to modify socket {sockOrFd} with FD={fd}.")
                         return False
 
                     else:
-                        self._sockets[sockOrFd] = (fd, forRead, forWrite)
+                        self._sockets[sockOrFd] = (fd, newMask)
                         return True
 
     def addForRead(self, socketOrFd) -> bool:
@@ -141,13 +144,14 @@ class SocketWatcher:
         return self.discard(socketOrFd, False, True)
 
     def discard(self, sockOrFd, discardRead: bool = True, discardWrite: bool = True) -> bool:
-        if sockOrFd in self._sockets:
-            curFd, currRead, currWrite = self._sockets[sockOrFd]
-            forRead = False if discardRead else currRead
-            forWrite = False if discardWrite else currWrite
+        current = self._sockets.get(sockOrFd)
+
+        if current is not None:
+            curFd, currMask = current
+            newMask = currMask & ~self.eventMask(discardRead, discardWrite)
             fd = self.fdForSockOrFd(sockOrFd)
 
-            if fd < 0 or (not forRead and not forWrite):
+            if fd < 0 or not newMask:
                 # remove socket completely
                 self._sockets.pop(sockOrFd)
                 self._fdToSocketObj.pop(curFd)
@@ -161,12 +165,12 @@ class SocketWatcher:
 
                 return True
 
-            elif forRead != currRead or forWrite != currWrite:
+            elif newMask != currMask:
                 # modify socket
-                self._sockets[sockOrFd] = (curFd, forRead, forWrite)
+                self._sockets[sockOrFd] = (curFd, newMask)
 
                 try:
-                    self._epoll.modify(curFd, self.eventMask(forRead, forWrite))
+                    self._epoll.modify(curFd, newMask)
                     return True
 
                 except Exception: